@@ -1,22 +1,15 @@
 # app.py — Streamlit AI Character + Video Generator (fixed version)
-import os, time, io, textwrap, requests
+import hashlib, os, re, shutil, subprocess, tempfile, time, io, uuid, requests
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 
-# ✅ Self-install fallback for gTTS if missing
-try:
-    from gtts import gTTS
-except ImportError:
-    os.system("pip install gTTS==2.5.1")
-    from gtts import gTTS
-
-# ✅ Install moviepy only if missing (fixes build issues)
-try:
-    from moviepy.editor import ImageClip, AudioFileClip, CompositeVideoClip, TextClip
-except ImportError:
-    os.system("pip install moviepy==1.0.3")
-    from moviepy.editor import ImageClip, AudioFileClip, CompositeVideoClip, TextClip
+# Pillow and gTTS are imported lazily inside the handlers below: they are
+# only needed after the user clicks Generate, and keeping them out of the
+# module scope trims Streamlit's cold-start time for every plain rerun.
 
 # ---- SETTINGS ----
 st.set_page_config(page_title="AI Character Studio", page_icon="🎬", layout="centered")
@@ -26,6 +19,42 @@ st.write("Create AI character images, auto scripts, voice, and short videos —
 HF_IMG_URL = "https://api-inference.huggingface.co/models/runwayml/stable-diffusion-v1-5"
 HF_TEXT_URL = "https://api-inference.huggingface.co/models/google/flan-t5-base"
 
+# Intermediate files live in RAM-backed /dev/shm when available: ffmpeg
+# re-reads the still image many times during the encode, and tmpfs reads
+# are far cheaper than the overlay filesystem on Streamlit Cloud.
+if "AICHAR_WORK_DIR" in os.environ:
+    WORK_DIR = Path(os.environ["AICHAR_WORK_DIR"])
+elif Path("/dev/shm").exists():
+    WORK_DIR = Path("/dev/shm/aichar")
+else:
+    WORK_DIR = Path(tempfile.gettempdir()) / "aichar"
+WORK_DIR.mkdir(parents=True, exist_ok=True)
+
+def _clean_workdir(max_age=600):
+    """Unlink finished per-generation files older than max_age on tmpfs."""
+    cutoff = time.time() - max_age
+    for pattern in ("final_*.mp4", "final_*_overlay.png", "voice_*.mp3"):
+        for stale in WORK_DIR.glob(pattern):
+            try:
+                if stale.stat().st_mtime < cutoff:
+                    stale.unlink()
+            except OSError:
+                pass
+
+_clean_workdir()
+
+if "executor" not in st.session_state:
+    st.session_state.executor = ThreadPoolExecutor(max_workers=6)
+
+@st.cache_resource(show_spinner=False)
+def warmup_endpoints():
+    """Resolve DNS and complete the TLS handshake for both HF hosts up front."""
+    for url in (HF_IMG_URL, HF_TEXT_URL):
+        try:
+            get_session(None).head(url, timeout=5)
+        except Exception:
+            pass
+
 # ---- Sidebar (token + settings) ----
 with st.sidebar:
     st.header("🔑 Hugging Face Token")
@@ -39,16 +68,87 @@ with st.sidebar:
     st.caption("If you leave it blank, it’ll use public inference (slower).")
 
 # ---- Helper Functions ----
-def hf_image(prompt, token):
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
-    res = requests.post(HF_IMG_URL, headers=headers, json={"inputs": prompt}, stream=True)
-    if res.status_code != 200:
-        raise Exception(f"Hugging Face image failed: {res.text}")
-    return res.content
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_session(token):
+    """One pooled session per token so HF calls reuse the keep-alive connection.
+
+    cache_resource (not lru_cache) so the pool survives Streamlit reruns,
+    which re-execute the module and would otherwise reset a module-level cache.
+    """
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            # POST is not retried by default; HF answers cold starts with 503,
+            # so opt in explicitly and back off while the model loads.
+            max_retries=Retry(
+                total=5,
+                backoff_factor=1.5,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=["POST"],
+            ),
+        ),
+    )
+    if token:
+        session.headers["Authorization"] = f"Bearer {token}"
+    return session
+
+IMG_CACHE_DIR = WORK_DIR / "img_cache"
+
+def hf_image(prompt, token, variant=0):
+    """Stream the generated image straight to disk, keyed by prompt hash.
 
-def hf_text(prompt, token):
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
-    res = requests.post(HF_TEXT_URL, headers=headers, json={"inputs": prompt})
+    The response body never materializes as a bytes object in Python, and a
+    repeated prompt is served from the on-disk file without touching HF.
+    `variant` distinguishes multiple samples of the same prompt in the cache.
+    """
+    key = hashlib.sha256(f"{prompt}|{variant}".encode()).hexdigest()
+    cached = next(
+        (p for p in IMG_CACHE_DIR.glob(f"{key}.*") if p.suffix != ".part"), None
+    )
+    if cached is not None:
+        cached.touch()
+        return str(cached)
+    IMG_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Prefer WebP/JPEG over HF's default PNG: smaller transfer, ~5x faster decode.
+    headers = {"Accept": "image/webp,image/jpeg,image/*;q=0.8"}
+    # wait_for_model holds the connection through cold starts instead of
+    # failing with 503; server-side caching is only wanted for the first
+    # variant, otherwise every variant would get the same cached sample.
+    payload = {
+        "inputs": prompt,
+        "options": {"wait_for_model": True, "use_cache": variant == 0},
+    }
+    with get_session(token).post(
+        HF_IMG_URL, json=payload, headers=headers, stream=True, timeout=120
+    ) as res:
+        if res.status_code != 200:
+            raise Exception(f"Hugging Face image failed: {res.text}")
+        content_type = res.headers.get("Content-Type", "image/png")
+        suffix = {"image/webp": ".webp", "image/jpeg": ".jpg"}.get(content_type, ".png")
+        path = IMG_CACHE_DIR / f"{key}{suffix}"
+        # Stream into a .part name and promote atomically: an interrupted
+        # transfer must never leave a truncated file at the real cache key,
+        # where every later run would treat it as a hit.
+        part = path.with_suffix(path.suffix + ".part")
+        res.raw.decode_content = True
+        try:
+            with open(part, "wb") as f:
+                shutil.copyfileobj(res.raw, f, length=64 * 1024)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        os.replace(part, path)
+    # Covers the *_720.jpg resizes prepare_image writes alongside the sources.
+    _evict_cache(IMG_CACHE_DIR)
+    return str(path)
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def hf_text(prompt, _token):
+    payload = {"inputs": prompt, "options": {"wait_for_model": True, "use_cache": True}}
+    res = get_session(_token).post(HF_TEXT_URL, json=payload, timeout=60)
     if res.status_code != 200:
         raise Exception(f"Hugging Face text failed: {res.text}")
     data = res.json()
@@ -56,52 +156,281 @@ def hf_text(prompt, token):
         return data[0]["generated_text"]
     return str(data)
 
+TTS_CACHE_DIR = WORK_DIR / "tts_cache"
+CACHE_DIR_LIMIT = 100 * 1024 * 1024  # bytes
+
+def _evict_cache(directory, limit=CACHE_DIR_LIMIT):
+    """Drop the oldest cached files once the directory exceeds the size limit."""
+    files = sorted(directory.glob("*"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    while files and total > limit:
+        oldest = files.pop(0)
+        total -= oldest.stat().st_size
+        oldest.unlink(missing_ok=True)
+
+@lru_cache(maxsize=1)
+def _gtts_prefs():
+    """Build gTTS's pre-processors and tokenizer once.
+
+    gTTS recompiles the tokenizer regexes on every instantiation; with one
+    instance per sentence that overhead is pure waste.
+    """
+    from gtts.tokenizer import Tokenizer, pre_processors, tokenizer_cases
+
+    pre = [
+        pre_processors.tone_marks,
+        pre_processors.end_of_line,
+        pre_processors.abbreviations,
+        pre_processors.word_sub,
+    ]
+    tokenize = Tokenizer([
+        tokenizer_cases.tone_marks,
+        tokenizer_cases.period_comma,
+        tokenizer_cases.colon,
+        tokenizer_cases.other_punctuation,
+    ]).run
+    return pre, tokenize
+
+def _tts_one(sentence, lang):
+    from gtts import gTTS
+
+    pre, tokenize = _gtts_prefs()
+    buf = io.BytesIO()
+    gTTS(
+        sentence, lang=lang, tld="com",
+        pre_processor_funcs=pre, tokenizer_func=tokenize,
+    ).write_to_fp(buf)
+    return buf.getvalue()
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def tts_bytes(script, lang):
+    # Disk cache survives app restarts; hits skip the gTTS network calls
+    # entirely (and the translate_tts rate limit along with them).
+    key = hashlib.sha256(f"{lang}|{script}".encode()).hexdigest()
+    cached = TTS_CACHE_DIR / f"{key}.mp3"
+    if cached.exists():
+        cached.touch()  # keep hot entries at the back of the LRU queue
+        return cached.read_bytes()
+
+    # Synthesize each sentence in parallel and concatenate the MP3s;
+    # every gTTS chunk is a complete MP3 stream, so byte-wise
+    # concatenation needs no re-encode.
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", script.strip()) if s]
+    if len(sentences) <= 1:
+        audio = _tts_one(script, lang)
+    else:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            chunks = list(pool.map(lambda s: _tts_one(s, lang), sentences))
+        audio = b"".join(chunks)
+
+    TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cached.write_bytes(audio)
+    _evict_cache(TTS_CACHE_DIR)
+    return audio
+
 def fallback_script(topic):
     return f"This is a short cinematic message about {topic}. Discipline beats luck. Action creates power. Keep moving forward."
 
-def make_video(img_path, audio_path, text_overlay, duration=8, out_path="final.mp4"):
-    img_clip = ImageClip(img_path).set_duration(duration)
-    txt_clip = TextClip(
-        text_overlay, fontsize=36, color="white", method="caption", size=(680, None)
-    ).set_position(("center", 0.1)).set_duration(duration)
-    audio_clip = AudioFileClip(audio_path)
-    final = CompositeVideoClip([img_clip, txt_clip]).set_audio(audio_clip)
-    final.write_videofile(out_path, fps=24, codec="libx264", audio_codec="aac", verbose=False, logger=None)
+@st.cache_resource(show_spinner=False)
+def caption_font_path():
+    """Resolve the caption font file once; fc-match costs ~100-300 ms per call."""
+    try:
+        path = subprocess.check_output(
+            ["fc-match", "-f", "%{file}", "DejaVuSans-Bold"], text=True, timeout=5
+        ).strip()
+        if path:
+            return path
+    except Exception:
+        pass
+    return "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+@lru_cache(maxsize=4)
+def _caption_font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(caption_font_path(), size)
+    except OSError:
+        return ImageFont.load_default()
+
+def prepare_image(img_path):
+    """Resize the character image once, instead of per-frame inside MoviePy."""
+    from PIL import Image
+
+    resized = str(Path(img_path).with_suffix("")) + "_720.jpg"
+    # Source files are content-addressed, so an existing resize is still valid.
+    if Path(resized).exists():
+        return resized
+    img = Image.open(img_path).convert("RGB")
+    img.thumbnail((720, 1280), Image.LANCZOS)
+    img.save(resized, "JPEG", quality=88, optimize=True)
+    return resized
+
+def _wrap_to_width(text, font, max_width):
+    """Word-wrap by measured pixel width rather than character count."""
+    lines = []
+    for raw_line in text.splitlines() or [""]:
+        line = ""
+        for word in raw_line.split():
+            trial = f"{line} {word}".strip()
+            if line and font.getlength(trial) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = trial
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+def render_overlay(text, out_path, fontsize=36, max_width=640):
+    """Pre-render the caption to a transparent PNG with Pillow.
+
+    Replaces MoviePy's TextClip, which shells out to ImageMagick per clip.
+    """
+    from PIL import Image, ImageDraw
+
+    font = _caption_font(fontsize)
+    text = _wrap_to_width(text, font, max_width)
+    probe = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    bbox = probe.multiline_textbbox((0, 0), text, font=font, align="center", stroke_width=2)
+    img = Image.new("RGBA", (bbox[2] + 8, bbox[3] + 8), (0, 0, 0, 0))
+    ImageDraw.Draw(img).multiline_text(
+        (4, 4), text, font=font, fill="white", align="center",
+        stroke_width=2, stroke_fill="black",
+    )
+    img.save(out_path)
     return out_path
 
+_HW_ENCODERS = ("h264_nvenc", "h264_videotoolbox", "h264_qsv")
+_X264_STILL_PARAMS = ["-preset", "ultrafast", "-tune", "stillimage",
+                      "-x264-params", "keyint=240:min-keyint=240:scenecut=0"]
+
+@st.cache_resource(show_spinner=False)
+def find_ffmpeg():
+    """Locate an ffmpeg binary: PATH first, then the one imageio-ffmpeg ships."""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def video_encoder():
+    """Pick a hardware H.264 encoder when ffmpeg offers one, else libx264."""
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        try:
+            listing = subprocess.run(
+                [ffmpeg, "-hide_banner", "-encoders"],
+                capture_output=True, text=True, timeout=10,
+            ).stdout
+            return next((e for e in _HW_ENCODERS if e in listing), "libx264")
+        except Exception:
+            pass
+    return "libx264"
+
+def make_video(img_path, audio_path, text_overlay, duration=8, out_path=None):
+    # One ffmpeg call loops the still image and muxes in the audio directly,
+    # instead of MoviePy piping 24*duration identical frames through Python.
+    if out_path is None:
+        out_path = str(WORK_DIR / f"final_{uuid.uuid4().hex[:8]}.mp4")
+    resized = prepare_image(img_path)
+    # The overlay shares the clip's unique name: a fixed path would let
+    # concurrent sessions overwrite each other's caption mid-render.
+    overlay_png = render_overlay(
+        text_overlay, f"{Path(out_path).with_suffix('')}_overlay.png"
+    )
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        raise Exception("ffmpeg not found — install ffmpeg or imageio-ffmpeg")
+
+    encoder = video_encoder()
+    filter_complex = (
+        "[0:v]scale=720:1280:force_original_aspect_ratio=decrease,"
+        "pad=720:1280:(ow-iw)/2:(oh-ih)/2[bg];"
+        "[bg][2:v]overlay=(W-w)/2:H*0.08[v]"
+    )
+    cmd = [
+        ffmpeg, "-y",
+        "-loop", "1", "-framerate", "24", "-i", resized,
+        "-i", audio_path,
+        "-i", overlay_png,
+        "-filter_complex", filter_complex,
+        "-map", "[v]", "-map", "1:a",
+        "-c:v", encoder,
+        *(_X264_STILL_PARAMS if encoder == "libx264" else []),
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-shortest", "-t", str(duration),
+        out_path,
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        tail = e.stderr.decode(errors="replace")[-500:] if e.stderr else ""
+        raise Exception(f"ffmpeg failed: {tail}")
+    return out_path
+
+warmup_endpoints()
+# Pre-warm the ffmpeg discovery and encoder probe so the first Generate
+# click goes straight to encoding; both are cache_resource, so later
+# reruns and sessions reuse the same handles.
+video_encoder()
+
 # ---- Main UI ----
-prompt = st.text_input(
-    "🧠 Describe your character:",
-    "cinematic portrait of a confident entrepreneur, golden rim light, 85mm lens",
-)
-topic = st.text_input("🎤 Topic for the short script:", "mindset and discipline")
-duration = st.slider("🎞️ Video length (seconds):", 6, 15, 8)
-lang = st.selectbox("🌎 Voice language:", ["en", "en-us", "en-uk", "es", "fr", "de"])
-
-if st.button("🚀 Generate Character + Script + Video"):
+# A form batches all widget edits into a single rerun on submit, instead of
+# re-executing the script on every keystroke and slider move.
+with st.form("gen"):
+    prompt = st.text_input(
+        "🧠 Describe your character:",
+        "cinematic portrait of a confident entrepreneur, golden rim light, 85mm lens",
+    )
+    topic = st.text_input("🎤 Topic for the short script:", "mindset and discipline")
+    duration = st.slider("🎞️ Video length (seconds):", 6, 15, 8)
+    lang = st.selectbox("🌎 Voice language:", ["en", "en-us", "en-uk", "es", "fr", "de"])
+    n_variants = st.number_input("🖼️ Image variants:", 1, 4, 1)
+    submitted = st.form_submit_button("🚀 Generate Character + Script + Video")
+
+if submitted:
     try:
-        with st.spinner("🖼️ Creating character image..."):
-            img_bytes = hf_image(prompt, hf_token)
-            img_path = "tmp/character.png"
-            Path("tmp").mkdir(exist_ok=True)
-            with open(img_path, "wb") as f:
-                f.write(img_bytes)
-            st.image(img_path, caption="Generated Character", use_column_width=True)
+        # Fan the network work out over the executor: text and image run
+        # concurrently, and TTS starts the moment the script is ready, so
+        # wall-clock is max(image, text + tts) instead of the sum.
+        executor = st.session_state.executor
+        script_future = executor.submit(
+            hf_text, f"Write a short motivational monologue about {topic}.", hf_token
+        )
+        img_futures = [
+            executor.submit(hf_image, prompt, hf_token, i) for i in range(int(n_variants))
+        ]
 
         with st.spinner("📝 Writing short script..."):
             try:
-                script = hf_text(f"Write a short motivational monologue about {topic}.", hf_token)
+                script = script_future.result(timeout=60)
             except Exception:
                 script = fallback_script(topic)
-            st.text_area("🎬 Generated Script:", script, height=120)
+        audio_future = executor.submit(tts_bytes, script, lang.split("-")[0])
+
+        with st.spinner("🖼️ Creating character image..."):
+            img_paths = [f.result(timeout=120) for f in img_futures]
+            if len(img_paths) == 1:
+                st.image(img_paths[0], caption="Generated Character", use_column_width=True)
+            else:
+                for i, (col, path) in enumerate(zip(st.columns(len(img_paths)), img_paths)):
+                    col.image(path, caption=f"Variant {i + 1}", use_column_width=True)
+            img_path = img_paths[0]
+        st.text_area("🎬 Generated Script:", script, height=120)
 
         with st.spinner("🎧 Creating voice..."):
-            tts = gTTS(script, lang=lang.split("-")[0])
-            audio_path = "tmp/voice.mp3"
-            tts.save(audio_path)
+            audio_path = str(WORK_DIR / f"voice_{uuid.uuid4().hex[:8]}.mp3")
+            with open(audio_path, "wb") as f:
+                f.write(audio_future.result(timeout=60))
 
         with st.spinner("🎥 Rendering final cinematic clip..."):
-            out_path = make_video(img_path, audio_path, textwrap.fill(script, 40), duration)
+            out_path = make_video(img_path, audio_path, script, duration)
             st.video(out_path)
             with open(out_path, "rb") as f:
                 st.download_button("⬇️ Download MP4", f, "ai_character_clip.mp4")